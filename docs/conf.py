@@ -1,18 +1,53 @@
-import tomllib
 import re
 from os import getenv
 from datetime import datetime
 from pathlib import Path
+from typing import TypedDict
 
 pyproject_path = Path(__file__).parent.parent.joinpath("pyproject.toml")
 
-with open(pyproject_path, "rb") as fp:
-    pyproject = tomllib.load(fp)
+
+_section_re = re.compile(r"(?m)^\[tool\.poetry\]\s*$(.*?)(?=^\[|\Z)", re.DOTALL)
+_string_field_re = r'(?m)^\s*{}\s*=\s*"([^"]+)"'
+_array_field_re = r"(?m)^\s*{}\s*=\s*\[([^\]]*)\]"
+_string_re = re.compile(r'"([^"]+)"')
+
+
+class _PoetryFields(TypedDict):
+    name: str
+    authors: list[str]
+    version: str
+
+
+def _extract_poetry_fields(text: str) -> _PoetryFields:
+    """Extract the few [tool.poetry] fields we need without a full TOML parse."""
+    section = _section_re.search(text)
+    assert section is not None
+    poetry = section.group(1)
+
+    def _string(key: str):
+        m = re.search(_string_field_re.format(key), poetry)
+        assert m is not None
+        return m.group(1)
+
+    def _array(key: str):
+        m = re.search(_array_field_re.format(key), poetry)
+        assert m is not None
+        return _string_re.findall(m.group(1))
+
+    return {
+        "name": _string("name"),
+        "authors": _array("authors"),
+        "version": _string("version"),
+    }
+
+
+pyproject = _extract_poetry_fields(pyproject_path.read_text("utf-8"))
 
 now = datetime.now()
 
-project = pyproject["tool"]["poetry"]["name"]
-authors = pyproject["tool"]["poetry"]["authors"]
+project = pyproject["name"]
+authors = pyproject["authors"]
 
 author_re = re.compile(r"^(\w+(?: \w+)*)(?: \(([^)]+)\))?(?: <([^>]+)>)?$")
 
@@ -26,7 +61,7 @@ def _author(author: str):
 author = ", ".join(map(_author, authors))
 copyright = "{}, {}".format(now.year, author)
 
-release = pyproject["tool"]["poetry"]["version"]
+release = pyproject["version"]
 
 
 def _version(release: str, sep: str = "."):
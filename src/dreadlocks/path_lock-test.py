@@ -1,3 +1,4 @@
+import atexit
 import json
 import os
 import time
@@ -9,12 +10,15 @@ from concurrent.futures import (
     Future,
 )
 from contextlib import contextmanager, AbstractContextManager
-from itertools import chain, groupby
+from functools import partial
+from itertools import chain
 from multiprocessing import get_context
+from multiprocessing.managers import SyncManager
 from pathlib import Path
-from queue import Queue
+from queue import Empty, Queue
 from random import random
 from threading import Barrier
+from types import SimpleNamespace
 from typing import (
     Any,
     TypeVar,
@@ -26,6 +30,7 @@ from typing import (
     TypedDict,
     Union,
     Literal,
+    NamedTuple,
 )
 
 import pytest
@@ -45,23 +50,6 @@ T = TypeVar("T")
 mp = get_context(method="spawn")
 
 
-class chdir(AbstractContextManager[None]):
-    """Non thread-safe context manager to change the current working directory.
-    (copied from contextlib's implementation in Python 3.11)
-    """
-
-    def __init__(self, path: str):
-        self.path: str = path
-        self._old_cwd: list[str] = []
-
-    def __enter__(self):
-        self._old_cwd.append(os.getcwd())
-        os.chdir(self.path)
-
-    def __exit__(self, *_):
-        os.chdir(self._old_cwd.pop())
-
-
 class Manager(Protocol):
     def Barrier(
         self,
@@ -73,43 +61,58 @@ class Manager(Protocol):
     def Queue(self, maxsize: int = 0) -> Queue[Any]: ...
 
 
-class SimpleThreadManager:
-    def Barrier(
-        self,
-        parties: int,
-        action: Optional[Callable[[], None]] = None,
-        timeout: Optional[int] = None,
-    ) -> Barrier:
-        return Barrier(parties, action, timeout)
-
-    def Queue(self, maxsize: int = 0) -> Queue[Any]:
-        return Queue[Any](maxsize)
+_thread_manager = cast(Manager, SimpleNamespace(Barrier=Barrier, Queue=Queue))
 
 
 class Parallelization(Protocol):
     def __call__(self, n: int) -> AbstractContextManager[tuple[Executor, Manager]]: ...
 
 
+_manager: Optional[SyncManager] = None
+
+
+def _shared_manager() -> SyncManager:
+    # NOTE: Barrier and Queue objects are sent to workers through submit, so
+    # they have to be manager proxies. We start the manager server once per
+    # test process instead of once per test.
+    global _manager
+    if _manager is None:
+        _manager = mp.Manager()
+        atexit.register(_manager.shutdown)
+    return _manager
+
+
+def _shutdown_shared_manager():
+    global _manager
+    if _manager is not None:
+        _manager.shutdown()
+        _manager = None
+
+
 @contextmanager
 def processes(n: int):
     with ProcessPoolExecutor(max_workers=n, mp_context=mp) as executor:
-        with mp.Manager() as m:
-            yield executor, cast(Manager, m)
+        try:
+            yield executor, cast(Manager, _shared_manager())
+        except BaseException:
+            # NOTE: Workers may be stuck waiting on a proxy that will never be
+            # released. Shutting down the manager makes those calls fail so
+            # that the executor can exit. The next test starts a new manager.
+            _shutdown_shared_manager()
+            raise
 
 
 @contextmanager
 def threads(n: int):
     with ThreadPoolExecutor(max_workers=n) as executor:
-        yield executor, SimpleThreadManager()
+        yield executor, _thread_manager
 
 
 @contextmanager
 def lock(directory: str):
-    with chdir(directory):
-        lock = Path("lock")
-        lock.touch()
-        path = str(lock)
-        yield path
+    path = str(Path(directory) / "lock")
+    os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o644))
+    yield path
 
 
 def lock_first(is_locked: Barrier, is_done: Barrier, path: str, shared: bool):
@@ -125,10 +128,11 @@ def lock_rest(
     shared: bool,
     blocking: bool,
 ):
+    wait_done = is_done if is_done is not None and shared else None
     is_locked.wait()
     with path_lock(path, shared=shared, blocking=blocking):
-        if is_done is not None and shared:
-            is_done.wait()
+        if wait_done is not None:
+            wait_done.wait()
 
 
 @pytest.mark.parametrize(
@@ -141,17 +145,16 @@ def lock_rest(
 @pytest.mark.parametrize(
     "shared",
     (
-        [False, True],
-        [False, False],
-        [False, True, False],
-        [False, True, True],
-        [False, False, True],
-        [False, False, False],
-        [True, False],
-        [True, True, False],
-        [True, False, False],
+        pytest.param([False, True], id="FT"),
+        pytest.param([False, False], id="FF"),
+        pytest.param([False, True, False], id="FTF"),
+        pytest.param([False, True, True], id="FTT"),
+        pytest.param([False, False, True], id="FFT"),
+        pytest.param([False, False, False], id="FFF"),
+        pytest.param([True, False], id="TF"),
+        pytest.param([True, True, False], id="TTF"),
+        pytest.param([True, False, False], id="TFF"),
     ),
-    ids=repr,
 )
 def test_non_blocking(
     tmp_path: str,
@@ -159,7 +162,8 @@ def test_non_blocking(
     exception: Type[AcquiringLockWouldBlockError],
     shared: list[bool],
 ):
-    if os.name == "nt" and "processes" in repr(parallelization):
+    is_processes = parallelization is processes
+    if os.name == "nt" and is_processes:
         pytest.skip("TODO Processes-based tests randomly fail on Windows.")
 
     assert len(shared) >= 2
@@ -168,10 +172,7 @@ def test_non_blocking(
     with lock(tmp_path) as path:
         n = len(shared)
         nb = 1 + (
-            1
-            if not shared[0]
-            or (os.name == "nt" and "processes" in repr(parallelization))
-            else sum(map(lambda s: 1 if s else 0, shared))
+            1 if not shared[0] or (os.name == "nt" and is_processes) else sum(shared)
         )
 
         with parallelization(n) as [executor, m]:
@@ -183,17 +184,11 @@ def test_non_blocking(
             tasks.append(
                 executor.submit(lock_first, is_locked, is_done, path, shared[0])
             )
+            blocking_rest = partial(
+                lock_rest, is_locked, is_done if nb >= 3 else None, path
+            )
             for s in shared[1:-1]:
-                tasks.append(
-                    executor.submit(
-                        lock_rest,
-                        is_locked,
-                        is_done if nb >= 3 else None,
-                        path,
-                        s,
-                        True,
-                    )
-                )
+                tasks.append(executor.submit(blocking_rest, s, True))
             tasks.append(
                 executor.submit(lock_rest, is_locked, None, path, shared[-1], False)
             )
@@ -215,12 +210,13 @@ def locked_threads(
         tasks: list[Future[T]] = []
         for params in parameters:
             tasks.append(executor.submit(fn, *params))
+        # NOTE: We must react to the first failure as soon as it completes,
+        # since the remaining tasks may be blocked until is_done is reached.
         for task in as_completed(tasks):
-            try:
-                task.result()
-            except:  # noqa E722
+            error = task.exception()
+            if error is not None:
                 is_done.wait()
-                raise
+                raise error
 
 
 @pytest.mark.parametrize("n_blocking", (0, 1, 2, 3, 4, 5))
@@ -269,7 +265,8 @@ def lock_exclusive(are_locked: Barrier, q: Queue[int], path: str, i: int):
 def test_many_shared_one_exclusive_blocking(
     tmp_path: str, parallelization: Parallelization
 ):
-    if os.name == "nt" and "processes" in repr(parallelization):
+    is_processes = parallelization is processes
+    if os.name == "nt" and is_processes:
         pytest.skip("TODO Processes-based tests randomly fail on Windows.")
 
     with lock(tmp_path) as path:
@@ -278,11 +275,12 @@ def test_many_shared_one_exclusive_blocking(
         with parallelization(n) as [executor, m]:
             results_queue = m.Queue()
 
+            # NOTE: Barriers are cyclic so they can be reused across rounds.
+            are_locked = m.Barrier(n)
+
             # NOTE: We run the test twice to reuse workers to catch errors where
             # some workers are left in a locked state.
             for _ in range(2):
-                are_locked = m.Barrier(n)
-
                 for i in range(1, n):
                     executor.submit(lock_shared, are_locked, results_queue, path, i)
                 last = executor.submit(
@@ -341,14 +339,13 @@ def test_reentrant(tmp_path: str, shared: bool):
 @pytest.mark.parametrize(
     "shared",
     (
-        [True, False],
-        [False, True],
-        [True, False, True],
-        [False, True, False],
-        [True, True, False],
-        [False, False, True],
+        pytest.param([True, False], id="TF"),
+        pytest.param([False, True], id="FT"),
+        pytest.param([True, False, True], id="TFT"),
+        pytest.param([False, True, False], id="FTF"),
+        pytest.param([True, True, False], id="TTF"),
+        pytest.param([False, False, True], id="FFT"),
     ),
-    ids=repr,
 )
 def test_reentrant_mixed(tmp_path: str, shared: list[bool]):
     with lock(tmp_path) as path:
@@ -364,24 +361,27 @@ def test_reentrant_mixed(tmp_path: str, shared: list[bool]):
 
 def exclusive_thread_write(path: str, i: int):
     with path_lock(path, shared=False) as fd:
-        try:
-            with open(fd, closefd=False) as fp:
-                fp.seek(0)
-                done: list[int] = json.load(fp)
-        except json.decoder.JSONDecodeError:
-            done: list[int] = []
+        os.lseek(fd, 0, os.SEEK_SET)
+        raw = os.read(fd, 1 << 20)
+        done: list[int] = json.loads(raw) if raw else []
 
         done.append(i)
-        with open(fd, "w", closefd=False) as fp:
-            fp.seek(0)
-            fp.truncate(0)
-            json.dump(done, fp)
-            fp.seek(0)
+        os.ftruncate(fd, 0)
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.write(fd, json.dumps(done).encode())
+        os.lseek(fd, 0, os.SEEK_SET)
+
+
+_executor: Optional[ThreadPoolExecutor] = None
 
 
 def many_exclusive_threads_and_processes_rw_process(path: str, indices: list[int]):
-    with ThreadPoolExecutor(max_workers=len(indices)) as executor:
-        executor.map(exclusive_thread_write, [path] * len(indices), indices)
+    # NOTE: Pool workers are reused across items, so is their thread pool.
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=len(indices))
+        atexit.register(_executor.shutdown)
+    list(_executor.map(partial(exclusive_thread_write, path), indices))
 
 
 def test_many_exclusive_threads_and_processes_rw(tmp_path: str):
@@ -392,12 +392,7 @@ def test_many_exclusive_threads_and_processes_rw(tmp_path: str):
         m = 10
         n = m**2
         items = list(range(n))
-        partition: list[list[int]] = list(
-            map(
-                lambda g: list(map(lambda t: t[1], g[1])),
-                groupby(enumerate(items), lambda t: t[0] // m),
-            )
-        )
+        partition: list[list[int]] = [items[i * m : (i + 1) * m] for i in range(m)]
 
         assert len(partition) == m
         assert sorted(chain(*partition)) == items
@@ -419,18 +414,15 @@ def test_many_exclusive_threads_and_processes_rw(tmp_path: str):
 
 @pytest.mark.parametrize("parallelization, n", ((threads, 200), (processes, 20)))
 def test_many_exclusive(tmp_path: str, parallelization: Parallelization, n: int):
-    if os.name == "nt" and "processes" in repr(parallelization):
+    is_processes = parallelization is processes
+    if os.name == "nt" and is_processes:
         pytest.skip("TODO Processes-based tests randomly fail on Windows.")
 
     with lock(tmp_path) as path:
         items = list(range(n))
 
         with parallelization(n) as (executor, _):
-            executor.map(
-                exclusive_thread_write,
-                [path] * n,
-                items,
-            )
+            executor.map(partial(exclusive_thread_write, path), items)
 
         with path_lock(path, shared=False) as fd:
             with open(fd, closefd=False) as fp:
@@ -469,7 +461,8 @@ def lock_shared_chained(
 def test_chained_shared_one_exclusive_blocking(
     tmp_path: str, parallelization: Parallelization
 ):
-    if os.name == "nt" and "processes" in repr(parallelization):
+    is_processes = parallelization is processes
+    if os.name == "nt" and is_processes:
         pytest.skip("TODO Processes-based tests randomly fail on Windows.")
 
     with lock(tmp_path) as path:
@@ -478,12 +471,14 @@ def test_chained_shared_one_exclusive_blocking(
         with parallelization(n) as (executor, m):
             results_queue = m.Queue()
 
+            # NOTE: Barriers are cyclic so they can be reused as is. Each queue
+            # receives at most two messages per round.
+            first_is_locked = m.Barrier(2)
+            queues = [m.Queue(maxsize=2) for _ in range(n + 1)]
+
             # NOTE: We run the test twice to reuse workers to catch errors where
             # some workers are left in a locked state.
             for _ in range(2):
-                first_is_locked = m.Barrier(2)
-                queues = [m.Queue() for _ in range(n + 1)]
-
                 for i in range(n - 1):
                     executor.submit(
                         lock_shared_chained,
@@ -508,6 +503,12 @@ def test_chained_shared_one_exclusive_blocking(
 
                 assert results == sorted(range(n))
 
+                # NOTE: The chain leaves exactly one unconsumed message in the
+                # queues of the first and last shared locks. Every message was
+                # sent before the exclusive lock could be acquired.
+                assert queues[1].get_nowait() == 0
+                assert queues[n - 1].get_nowait() == n - 2
+
 
 class Contents(TypedDict):
     id: int
@@ -515,10 +516,14 @@ class Contents(TypedDict):
     copy: int
 
 
-class Message(TypedDict):
+class Message(NamedTuple):
+    """Flat message so that workers only send a handful of scalars."""
+
     type: Union[Literal["read"], Literal["write"]]
     id: int
-    contents: Contents
+    contents_id: int
+    counter: int
+    copy: int
 
 
 def sync_read(
@@ -528,40 +533,44 @@ def sync_read(
     time.sleep(0.01 * random())
     with path_lock(path, shared=True):
         after.wait()
-        with open(filename) as fp:
-            contents = json.load(fp)
-    q.put({"type": "read", "id": i, "contents": contents})
+        with open(filename, "rb") as fp:
+            contents: Contents = json.loads(fp.read())
+    q.put(Message("read", i, contents["id"], contents["counter"], contents["copy"]))
 
 
 def sync_write(path: str, filename: str, q: Queue[Message], i: int):
     with path_lock(path, shared=False):
-        with open(filename) as fp:
-            contents = json.load(fp)
-
-        contents["id"] = i
-        contents["counter"] += 1
-
-        with open(filename, "w") as fp:
-            json.dump(contents, fp)
-
-        with open(filename) as fp:
-            contents = json.load(fp)
-
-        contents["copy"] += 1
+        with open(filename, "r+b") as fp:
+            contents: Contents = json.loads(fp.read())
+
+            # NOTE: The intermediate state, where copy lags behind counter, is
+            # flushed to the file so that unsynchronized reads would see it,
+            # and read back so that a concurrent writer would be detected.
+            contents["id"] = i
+            contents["counter"] += 1
+            fp.seek(0)
+            fp.truncate()
+            fp.write(json.dumps(contents).encode())
+            fp.flush()
 
-        with open(filename, "w") as fp:
-            json.dump(contents, fp)
+            fp.seek(0)
+            contents = json.loads(fp.read())
+            contents["copy"] += 1
+            fp.seek(0)
+            fp.truncate()
+            fp.write(json.dumps(contents).encode())
 
-    q.put({"type": "write", "id": i, "contents": contents})
+    q.put(Message("write", i, contents["id"], contents["counter"], contents["copy"]))
 
 
 @pytest.mark.parametrize("parallelization", (threads, processes))
 def test_synchronized_reads_blocking(tmp_path: str, parallelization: Parallelization):
-    if os.name == "nt" and "processes" in repr(parallelization):
+    is_processes = parallelization is processes
+    if os.name == "nt" and is_processes:
         pytest.skip("TODO Processes-based tests randomly fail on Windows.")
 
     with lock(tmp_path) as path:
-        filename = "rw"
+        filename = str(Path(tmp_path) / "rw")
 
         with open(filename, "w") as fp:
             json.dump({"id": -1, "counter": 0, "copy": 0}, fp)
@@ -593,11 +602,18 @@ def test_synchronized_reads_blocking(tmp_path: str, parallelization: Paralleliza
                     i += 1
                     w += 1
 
-                while (
-                    not q.empty() or len(messages) < i - k
-                ):  # NOTE: We empty the queue as much as possible
+                # NOTE: We empty the queue as much as possible
+                try:
+                    while True:
+                        messages.append(q.get_nowait())
+                        if messages[-1].type == "write":
+                            w -= 1
+                except Empty:
+                    pass
+
+                while len(messages) < i - k:
                     messages.append(q.get())
-                    if messages[-1]["type"] == "write":
+                    if messages[-1].type == "write":
                         w -= 1
 
             while len(messages) < n:
@@ -605,17 +621,17 @@ def test_synchronized_reads_blocking(tmp_path: str, parallelization: Paralleliza
 
         values: dict[int, int] = {}
         for message in messages:
-            t = message["type"]
+            t = message.type
             if t == "read":
-                i = message["id"]
+                i = message.id
                 g = group[i]
-                counter = message["contents"]["counter"]
+                counter = message.counter
                 # NOTE: counter is the same for the whole group
                 assert values.setdefault(g, counter) == counter
                 # NOTE: copy is identical to counter
-                assert message["contents"]["copy"] == counter
+                assert message.copy == counter
             else:
                 assert t == "write"
                 # NOTE: check nobody else wrote to file while we held the lock
-                assert message["id"] == message["contents"]["id"]
-                assert message["contents"]["copy"] == message["contents"]["counter"]
+                assert message.id == message.contents_id
+                assert message.copy == message.counter